@@ -7,20 +7,86 @@ by Christian Lawson-Perfect
 
 import argparse
 from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import json
+import os
 from pathlib import Path, PurePath
 import re
 import shutil
 from slugify import slugify
 import sys
+import time
 import zipfile
 
 import canvas_qti_1_2
 import blackboard_qti_2_1
 
+def root_location(root):
+    """
+        A picklable description of a package root, so that worker processes can open it themselves.
+        An open zipfile.Path can't be sent to another process, so send the name of the zip file instead.
+    """
+    if isinstance(root, zipfile.Path):
+        return ('zip', root.root.filename, root.at)
+    else:
+        return ('dir', str(root), '')
+
+def open_root(location):
+    """
+        Open a package root described by root_location.
+    """
+    kind, name, at = location
+    if kind == 'zip':
+        return zipfile.Path(name, at)
+    else:
+        return Path(name)
+
+# The package root opened by init_worker, shared by every quiz a worker process converts.
+worker_root = None
+
+def init_worker(location):
+    """
+        Open the package root once in each worker process.
+    """
+    global worker_root
+    worker_root = open_root(location)
+
+def plain_data(obj):
+    """
+        Copy a JSON-like structure, replacing bs4 strings with plain str objects.
+        A NavigableString keeps a reference to the document it came from, so an exam containing one would pickle the whole parse tree.
+    """
+    if isinstance(obj, dict):
+        return {plain_data(k): plain_data(v) for k, v in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [plain_data(x) for x in obj]
+    elif isinstance(obj, str):
+        return str(obj)
+    else:
+        return obj
+
+def convert_canvas_quiz(href, meta_href):
+    """
+        Convert a single Canvas quiz in a worker process, reading from the root opened by init_worker.
+
+        Parameters:
+            href - The path of the quiz's QTI 1.2 file, relative to the root.
+            meta_href - The path of the quiz's assessment metadata file, or None.
+
+        Returns a pair (exam, time taken in seconds).
+    """
+    start = time.perf_counter()
+    converter = IMS_to_Numbas(worker_root)
+    exam = converter.new_exam()
+    canvas_qti_1_2.QTI_1_2_to_Numbas(exam, converter.root / href)
+    if meta_href is not None:
+        converter.read_canvas_assessment_meta(converter.root / meta_href, exam)
+    return plain_data(exam), time.perf_counter() - start
+
 class IMS_to_Numbas(object):
-    def __init__(self,root):
+    def __init__(self,root,jobs=None):
         self.root = root
+        self.jobs = jobs
         self.exams = []
 
     def new_exam(self):
@@ -58,27 +124,59 @@ class IMS_to_Numbas(object):
 
         resources = manifest.select_one('manifest resources')
 
+        # Canvas quizzes are converted in a pool of worker processes.
+        # Each one gets a slot in self.exams so the exams stay in manifest order.
+        quizzes = []
+
         for r in resources.find_all('resource'):
             if r['type'] == 'imsqti_xmlv1p2':
                 fileinfo = r.find('file')
-                
-                exam = self.new_exam()
-                canvas_qti_1_2.QTI_1_2_to_Numbas(exam, self.root / fileinfo['href'])
+                meta_href = None
                 
                 dep = r.find('dependency')
                 if dep:
                     rd = resources.find('resource',identifier=dep['identifierref'])
                     if rd:
                         if rd['type'] == 'associatedcontent/imscc_xmlv1p1/learning-application-resource':
-                            fileinfo = rd.find('file')
-                            href = fileinfo['href']
-                            self.read_canvas_assessment_meta(self.root / href, exam)
+                            meta_href = rd.find('file')['href']
+
+                quizzes.append((len(self.exams), fileinfo['href'], meta_href))
+                self.exams.append(None)
             elif r['type'] == 'imsqti_test_xmlv2p1':
                 blackboard_qti_2_1.load_question_bank(self.new_exam(), self.root / r['href'])
 
+        if quizzes:
+            self.convert_canvas_quizzes(quizzes)
+
         num_exams = len(self.exams)
         print(f"Converted {num_exams} exams." if num_exams !=0 else 'Converted 1 exam.')
 
+    def convert_canvas_quizzes(self, quizzes):
+        """
+            Convert Canvas quizzes in parallel, putting each exam in its reserved slot in self.exams.
+
+            Parameters:
+                quizzes - A list of tuples (index in self.exams, href of the QTI file, href of the metadata file or None).
+        """
+        location = root_location(self.root)
+        total = len(quizzes)
+        max_workers = min(self.jobs or os.cpu_count(), total)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(location,)) as executor:
+            futures = {
+                executor.submit(convert_canvas_quiz, href, meta_href): (i, href)
+                for i, href, meta_href in quizzes
+            }
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    i, href = futures[future]
+                    exam, elapsed = future.result()
+                    self.exams[i] = exam
+                    print(f"[{done}/{total}] Converted {exam['name']} ({href}) in {elapsed:.2f}s")
+            except BaseException:
+                # Don't make the user wait for the rest of the quizzes before seeing the error.
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
     def write_exams(self, outpath):
         for exam in self.exams:
             self.write_exam(exam, outpath / (slugify(exam['name'])+'.exam'))
@@ -122,11 +220,24 @@ class IMS_to_Numbas(object):
             f.close()
             print("Created {}".format(outfile))
 
+def positive_int(value):
+    """
+        An argparse type for a whole number which is at least 1.
+    """
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not a whole number")
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {n}")
+    return n
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Convert a QTI item package to Numbas .exam files')
     parser.add_argument('input',help='The zip file or directory to convert.')
     parser.add_argument('-o','--output',default='.',help='The name of the .exam file to write. Defaults to the current directory.')
+    parser.add_argument('-j','--jobs',type=positive_int,default=None,help='The number of Canvas quizzes to convert at once. Defaults to the number of processors.')
 
     args = parser.parse_args()
 
@@ -134,7 +245,7 @@ if __name__ == '__main__':
     if root.suffix == '.zip':
         root = zipfile.Path(root)
 
-    converter = IMS_to_Numbas(root)
+    converter = IMS_to_Numbas(root, jobs=args.jobs)
     converter.process()
 
     outpath = Path(args.output)
@@ -0,0 +1,131 @@
+import pickle
+import pytest
+import sys
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import qti_to_numbas
+
+QUIZ = '''<?xml version="1.0" encoding="UTF-8"?>
+<questestinterop>
+  <assessment ident="quiz" title="Quiz">
+    <section ident="root_section">
+      <item ident="q1" title="Question">
+        <itemmetadata>
+          <qtimetadata>
+            <qtimetadatafield><fieldlabel>question_type</fieldlabel><fieldentry>multiple_choice_question</fieldentry></qtimetadatafield>
+            <qtimetadatafield><fieldlabel>points_possible</fieldlabel><fieldentry>1.0</fieldentry></qtimetadatafield>
+          </qtimetadata>
+        </itemmetadata>
+        <presentation>
+          <material><mattext texttype="text/html">Pick one</mattext></material>
+          <response_lid ident="response1" rcardinality="Single">
+            <render_choice>
+              <response_label ident="a"><material><mattext texttype="text/plain">Right</mattext></material></response_label>
+              <response_label ident="b"><material><mattext texttype="text/plain">Wrong</mattext></material></response_label>
+            </render_choice>
+          </response_lid>
+        </presentation>
+        <resprocessing>
+          <outcomes><decvar maxvalue="100" minvalue="0" varname="SCORE" vartype="Decimal"/></outcomes>
+          <respcondition continue="No">
+            <conditionvar><varequal respident="response1">a</varequal></conditionvar>
+            <setvar action="Set" varname="SCORE">100</setvar>
+          </respcondition>
+        </resprocessing>
+      </item>
+    </section>
+  </assessment>
+</questestinterop>
+'''
+
+def quiz(title):
+    return QUIZ.replace('title="Quiz"', f'title="{title}"')
+
+BANK = '''<?xml version="1.0" encoding="UTF-8"?>
+<assessmentTest identifier="bank" title="{}">
+</assessmentTest>
+'''
+
+def manifest(resources):
+    return '''<?xml version="1.0" encoding="UTF-8"?>
+<manifest identifier="manifest">
+  <resources>
+    {}
+  </resources>
+</manifest>
+'''.format('\n    '.join(resources))
+
+def canvas_resource(name):
+    return f'<resource identifier="{name}" type="imsqti_xmlv1p2"><file href="{name}/{name}.xml"/></resource>'
+
+def blackboard_resource(name):
+    return f'<resource identifier="{name}" type="imsqti_test_xmlv2p1" href="{name}.xml"/>'
+
+# Enough sibling elements to overflow the recursion limit if the parse tree gets pickled.
+META = '''<?xml version="1.0" encoding="UTF-8"?>
+<quiz identifier="quiz">
+  <title>Quiz title</title>
+  <description>A description</description>
+  <show_correct_answers>true</show_correct_answers>
+  {}
+</quiz>
+'''.format('\n  '.join(f'<setting{i}>{i}</setting{i}>' for i in range(100)))
+
+def test_converted_exam_pickles(tmp_path):
+    package = tmp_path / 'package.zip'
+    with zipfile.ZipFile(package, 'w') as z:
+        z.writestr('quiz/quiz.xml', QUIZ)
+        z.writestr('quiz/assessment_meta.xml', META)
+
+    qti_to_numbas.init_worker(qti_to_numbas.root_location(zipfile.Path(package)))
+    exam, elapsed = qti_to_numbas.convert_canvas_quiz('quiz/quiz.xml', 'quiz/assessment_meta.xml')
+
+    assert pickle.loads(pickle.dumps(exam)) == exam
+    assert type(exam['name']) is str
+    assert exam['name'] == 'Quiz title'
+    assert type(exam['metadata']['description']) is str
+    assert type(exam['question_groups'][0]['questions'][0]['parts'][0]['prompt']) is str
+
+def test_process_keeps_manifest_order(tmp_path):
+    names = ['quiz0', 'quiz1', 'bank', 'quiz2', 'quiz3', 'quiz4']
+    package = tmp_path / 'package.zip'
+    with zipfile.ZipFile(package, 'w') as z:
+        resources = []
+        for name in names:
+            if name == 'bank':
+                resources.append(blackboard_resource(name))
+                z.writestr(f'{name}.xml', BANK.format(name))
+            else:
+                resources.append(canvas_resource(name))
+                z.writestr(f'{name}/{name}.xml', quiz(name))
+        z.writestr('imsmanifest.xml', manifest(resources))
+
+    c = qti_to_numbas.IMS_to_Numbas(zipfile.Path(package), jobs=2)
+    c.process()
+
+    assert [e['name'] for e in c.exams] == names
+
+def test_process_in_subdirectory_of_zip(tmp_path):
+    package = tmp_path / 'package.zip'
+    with zipfile.ZipFile(package, 'w') as z:
+        z.writestr('export/imsmanifest.xml', manifest([canvas_resource('quiz0')]))
+        z.writestr('export/quiz0/quiz0.xml', quiz('quiz0'))
+
+    c = qti_to_numbas.IMS_to_Numbas(zipfile.Path(package, 'export/'), jobs=2)
+    c.process()
+
+    assert [e['name'] for e in c.exams] == ['quiz0']
+
+def test_process_raises_quiz_errors(tmp_path):
+    package = tmp_path / 'package.zip'
+    with zipfile.ZipFile(package, 'w') as z:
+        z.writestr('imsmanifest.xml', manifest([canvas_resource('quiz0'), canvas_resource('quiz1')]))
+        z.writestr('quiz0/quiz0.xml', quiz('quiz0'))
+        z.writestr('quiz1/quiz1.xml', QUIZ.replace('<fieldentry>1.0</fieldentry>', '<fieldentry>lots</fieldentry>'))
+
+    c = qti_to_numbas.IMS_to_Numbas(zipfile.Path(package), jobs=2)
+    with pytest.raises(ValueError):
+        c.process()